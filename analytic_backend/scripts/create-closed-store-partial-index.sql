@@ -0,0 +1,48 @@
+-- 폐업 점포 조회용 부분 인덱스 생성 스크립트
+-- survival_analysis.py의 업종별 생존 기간 집계는 폐업 점포("closeDate" IS NOT NULL)만 읽습니다.
+-- 폐업 여부로 테이블을 파티셔닝하는 대신, 폐업 점포만 담는 부분 커버링 인덱스로
+-- 집계 쿼리가 테이블 전체를 읽지 않고 인덱스만 스캔(Index Only Scan)하도록 합니다.
+--
+-- [파티셔닝을 사용하지 않는 이유]
+-- - PARTITION BY LIST (("closeDate" IS NULL))처럼 표현식을 파티션 키로 쓰면
+--   PRIMARY KEY(id)를 유지할 수 없습니다. (파티션 테이블의 PK/UNIQUE는 파티션 키 컬럼을 포함해야 하고 표현식은 불가)
+-- - 생성 컬럼(GENERATED)도 파티션 키로 사용할 수 없습니다.
+-- - 지오코딩 대상 조회(location IS NULL)는 폐업 여부와 무관하므로 파티션 프루닝 효과가 없습니다.
+--   (지오코딩 대상 조회는 create-geocode-pending-index.sql의 부분 인덱스를 사용)
+
+-- ============================================
+-- 1. 부분 커버링 인덱스 생성
+-- ============================================
+
+-- 폐업 점포만 인덱싱하고, 집계에 필요한 개업일/폐업일을 INCLUDE하여 힙 접근을 생략
+-- 주의: CONCURRENTLY는 트랜잭션 블록 안에서 실행할 수 없습니다.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_closed_store_sector
+    ON store ("sector")
+    INCLUDE ("openDate", "closeDate")
+    WHERE "closeDate" IS NOT NULL;
+
+-- 인덱스 생성 후 통계 정보 업데이트 (Index Only Scan을 위해 visibility map도 갱신)
+VACUUM ANALYZE store;
+
+-- ============================================
+-- 2. 인덱스 사용 여부 확인 (EXPLAIN ANALYZE)
+-- ============================================
+
+-- survival_analysis.py의 SURVIVAL_SUMMARY_SQL과 동일한 쿼리
+EXPLAIN ANALYZE
+SELECT
+    "sector",
+    ROUND(AVG("closeDate" - "openDate")::numeric, 2) AS avg_duration_days,
+    COUNT(*) AS sample_size
+FROM store
+WHERE "closeDate" IS NOT NULL
+  AND "openDate" IS NOT NULL
+  AND "sector" IS NOT NULL
+  AND "closeDate" >= "openDate"
+GROUP BY "sector";
+
+-- ============================================
+-- 참고: 인덱스 삭제 (필요시)
+-- ============================================
+
+-- DROP INDEX CONCURRENTLY IF EXISTS idx_closed_store_sector;
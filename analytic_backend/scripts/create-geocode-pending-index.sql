@@ -0,0 +1,35 @@
+-- 지오코딩 대기 점포 조회용 부분 인덱스 생성 스크립트
+-- geocode_script.py는 location이 NULL인 점포를 id 순서로 조회하므로,
+-- 인덱스가 없으면 store 테이블 전체를 순차 스캔한 뒤 정렬합니다.
+
+-- ============================================
+-- 1. 부분 인덱스 생성
+-- ============================================
+
+-- 지오코딩 대상(location IS NULL AND address IS NOT NULL) 행만 인덱싱
+-- 지오코딩이 진행될수록 인덱스 크기가 줄어듭니다.
+-- 주의: CONCURRENTLY는 트랜잭션 블록 안에서 실행할 수 없습니다.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS store_ungeocoded_idx
+    ON store (id)
+    WHERE location IS NULL AND address IS NOT NULL;
+
+-- 인덱스 생성 후 통계 정보 업데이트
+ANALYZE store;
+
+-- ============================================
+-- 2. 인덱스 사용 여부 확인 (EXPLAIN ANALYZE)
+-- ============================================
+
+-- geocode_script.py의 키셋 페이지 조회 쿼리와 동일한 형태 (0 대신 직전 페이지의 마지막 id)
+EXPLAIN ANALYZE
+SELECT id, address
+FROM store
+WHERE location IS NULL AND address IS NOT NULL AND id > 0
+ORDER BY id
+LIMIT 5000;
+
+-- ============================================
+-- 참고: 인덱스 삭제 (필요시)
+-- ============================================
+
+-- DROP INDEX CONCURRENTLY IF EXISTS store_ungeocoded_idx;
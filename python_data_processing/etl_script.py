@@ -1,5 +1,12 @@
 import os
+import re
+import io
+import csv
 import glob
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 import pandas as pd
 from sqlalchemy import create_engine, text
@@ -41,13 +48,33 @@ COLUMN_MAPPING = {
     "폐업일자": "closeDate"
 }
 
+# 날짜 구분자('-', '/', 공백)와 숫자형으로 저장된 날짜의 소수부('20190101.0'의 '.0') 제거용 정규식
+# (파일/컬럼마다 재컴파일하지 않도록 한 번만 컴파일)
+DATE_SEPARATOR_PATTERN = re.compile(r'[-/\s]|\.0+$')
+
+# C 엔진으로 CSV를 읽을 때 한 번에 읽을 행 수
+CSV_CHUNKSIZE = 200_000
+
+# COPY 스트림 한 번에 보낼 행 수
+COPY_CHUNKSIZE = 50000
+
 # --- 3. ETL 함수 정의 ---
 
 def connect_to_db():
     """데이터베이스 연결 엔진을 생성하고 반환합니다."""
     print(f"Connecting to database: {DB_NAME}...")
     try:
-        engine = create_engine(DATABASE_URL)
+        # executemany를 페이지 단위 multi-VALUES / execute_batch로 묶어 실행
+        # 적재용 커넥션은 QueuePool로 재사용하고, 끊어진 커넥션은 사용 전에 확인(pre-ping)
+        engine = create_engine(
+            DATABASE_URL,
+            pool_size=os.cpu_count(),
+            max_overflow=0,
+            pool_pre_ping=True,
+            executemany_mode='values_plus_batch',
+            insertmanyvalues_page_size=1000,
+            executemany_batch_page_size=500
+        )
         # 연결 테스트
         with engine.connect() as connection:
             result = connection.execute(text("SELECT 1"))
@@ -58,40 +85,181 @@ def connect_to_db():
         print(f"Database connection failed: {e}")
         return None
 
+def psql_copy(table, conn, keys, data_iter):
+    """
+    pandas.to_sql의 method로 사용하는 PostgreSQL COPY FROM STDIN 적재 함수.
+    multi-value INSERT 대신 CSV 스트림을 COPY로 전송하여 서버측 파싱/WAL 비용을 줄입니다.
+    """
+    raw = conn.connection
+    with raw.cursor() as cur:
+        buf = io.StringIO()
+        csv.writer(buf).writerows(data_iter)
+        buf.seek(0)
+
+        # storeName 등 대소문자 컬럼명을 유지하기 위해 식별자를 따옴표로 감쌈
+        columns = ', '.join(f'"{k}"' for k in keys)
+        table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+        cur.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH CSV", buf)
+
+def read_source_csv_chunks(file_path: str, delimiter: str) -> Iterator[pd.DataFrame]:
+    """
+    CSV 파일에서 필수 컬럼만 읽어 DataFrame 단위로 반환합니다.
+    pyarrow 엔진(멀티스레드 파서)을 우선 사용하여 파일 전체를 한 번에 읽고,
+    사용할 수 없으면 C 엔진으로 CSV_CHUNKSIZE 행씩 나누어 읽습니다.
+    """
+    read_options = {
+        'delimiter': delimiter,
+        'usecols': REQUIRED_COLUMNS,  # 필수 컬럼만 파싱하여 메모리/시간 절약
+        'dtype': {col: 'string' for col in REQUIRED_COLUMNS},  # 타입 추론 생략
+        'on_bad_lines': 'skip',
+    }
+    try:
+        df = pd.read_csv(file_path, encoding='cp949', engine='pyarrow', **read_options) # 한글 인코딩 (CP949) 사용
+    except Exception as e:
+        print(f"pyarrow engine unavailable for {file_path} ({e}). Falling back to C engine.")
+    else:
+        yield df
+        return
+
+    # pyarrow가 없거나 CP949 디코딩에 실패한 경우, 파이썬에서 디코딩한 스트림을 C 엔진에 전달
+    # dtype을 지정했으므로 low_memory=False(타입 추론을 위한 파일 전체 버퍼링) 없이 청크 단위로 읽음
+    with open(file_path, encoding='cp949') as f:
+        yield from pd.read_csv(f, engine='c', chunksize=CSV_CHUNKSIZE, **read_options)
+
+def parse_date_column(values: pd.Series) -> pd.Series:
+    """
+    'YYYYMMDD' 형식(구분자 포함 가능)의 날짜 컬럼을 datetime으로 변환합니다.
+    날짜 형식이 아니거나 NaN인 경우 NaT(Not a Time)로 변환합니다.
+    """
+    # 날짜 컬럼은 문자열(dtype='string')로 읽으므로, 구분자와 '.0' 소수부를 한 번의 정규식 치환으로 제거
+    values = values.astype('string').str.replace(DATE_SEPARATOR_PATTERN, '', regex=True)
+    # cache=True로 반복되는 날짜 문자열은 한 번만 파싱
+    return pd.to_datetime(values, format="%Y%m%d", errors='coerce', cache=True)
+
 def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     데이터프레임을 클리닝하고 DB 스키마에 맞게 변환합니다.
     """
     print("Starting data cleaning and transformation...")
 
-    # 1. 컬럼 이름 변경 및 불필요한 컬럼 제거
-    df = df.rename(columns=COLUMN_MAPPING)
-    df = df[COLUMN_MAPPING.values()]
-
-    # 2. 날짜 형식 변환 및 결측치 처리
-    # 허가신고일과 폐업일자는 'YYYYMMDD' 형식으로 되어있으므로, 'YYYY-MM-DD'로 변환
-    for col in ["openDate", "closeDate"]:
-        # 숫자를 문자열로 변환 (날짜가 숫자형인 경우)
-        df[col] = df[col].astype(str).str.replace('/', '').str.replace('-', '').str.replace(' ', '')
-        # 날짜 형식이 아니거나 NaN인 경우 NaT(Not a Time)로 변환
-        df[col] = pd.to_datetime(df[col], format="%Y%m%d", errors='coerce')
-    
-    # 3. 필수 데이터 확인 및 결측치 제거
+    # 1. 불필요한 컬럼 제거 및 컬럼 이름 변경
+    df = df[REQUIRED_COLUMNS].rename(columns=COLUMN_MAPPING)
+
+    # 2. 필수 데이터 확인
     # storeName과 address가 비어있으면 의미없는 데이터이므로 제거
-    df.dropna(subset=['storeName', 'address'], inplace=True)
-    # 빈 문자열도 제거
-    df = df[df['storeName'].str.strip() != '']
-    df = df[df['address'].str.strip() != '']
-    
-    # 4. 초기 GEOMETRY 컬럼 (location)과 WKT 컬럼 (location_wkt) 추가
-    # location_wkt는 임시로 주소 문자열을 보관하거나, None으로 처리
-    df['location_wkt'] = None 
-    # location 컬럼은 Geocoding 전이므로 일단 비워둠 (NULL)
-    df['location'] = None
+    # 앞뒤 공백을 제거한 뒤, 결측치와 빈 문자열을 하나의 마스크로 판별
+    store_name = df['storeName'].str.strip()
+    address = df['address'].str.strip()
+    mask = ((store_name.str.len() > 0) & (address.str.len() > 0)).fillna(False).astype(bool)
+
+    # 3. 필터링과 날짜 변환을 한 번의 assign으로 처리
+    # 날짜 변환은 필터링 이후의 행에만 수행
+    # location/location_wkt(GEOMETRY)는 Geocoding 전이므로 적재 대상에서 제외하고 DB 기본값(NULL)에 맡김
+    df = df.loc[mask].assign(
+        storeName=store_name[mask],
+        address=address[mask],
+        openDate=lambda d: parse_date_column(d['openDate']),
+        closeDate=lambda d: parse_date_column(d['closeDate'])
+    )
 
     print(f"Data cleaning complete. {len(df)} rows remaining.")
     return df
 
+def process_file(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    파일 하나를 추출(Extraction)하고 변환(Transformation)합니다.
+    프로세스 풀의 워커에서 실행되므로 DB 엔진에는 접근하지 않습니다.
+    적재할 데이터가 없거나 오류가 발생하면 None을 반환합니다.
+    """
+    print(f"\n--- Processing file: {file_path} ---")
+    try:
+        # 1. Extraction (추출)
+        # 2019년도 파일은 세미콜론으로 구분되어 있음
+        delimiter = ';' if '2019' in file_path else ','
+
+        # 필수 컬럼 존재 여부 확인 (헤더만 읽어서 확인)
+        header = pd.read_csv(file_path, encoding='cp949', delimiter=delimiter, nrows=0)
+        missing_cols = [col for col in REQUIRED_COLUMNS if col not in header.columns]
+        if missing_cols:
+            print(f"Skipping file: {file_path}. Missing columns: {', '.join(missing_cols)}")
+            return None
+
+        # 2. Transformation (변환)
+        # 청크별로 클리닝하여 원본 청크는 바로 해제하고, 정제된 결과만 모음
+        # (정제된 결과는 파일 단위로 합쳐 부모 프로세스에 전달하므로, 메모리 사용량은 파일 크기에 비례)
+        df_cleaned = pd.concat(
+            [clean_data(chunk) for chunk in read_source_csv_chunks(file_path, delimiter)],
+            ignore_index=True
+        )
+        
+        if df_cleaned.empty:
+            print(f"No valid data remaining in {file_path} after cleaning. Skipping insert.")
+            return None
+
+        return df_cleaned
+
+    except Exception as e:
+        print(f"An error occurred while processing {file_path}: {e}")
+        return None
+
+def iter_processed_files(all_files: List[str], max_workers: int) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+    """
+    프로세스 풀에서 파일을 처리하고, 완료된 순서대로 (파일 경로, 정제된 DataFrame)을 반환합니다.
+
+    - 동시에 실행 중인 작업은 최대 max_workers개로 제한하여, 적재가 느려도
+      부모 프로세스에 정제된 DataFrame이 파일 수만큼 쌓이지 않도록 합니다.
+    - 워커가 비정상 종료(OOM 등)되면 풀 전체가 깨지므로, 풀을 새로 만들고
+      함께 실행 중이던 파일은 원인 파일을 가려내기 위해 하나씩 단독으로 한 번 더 시도합니다.
+      단독 실행에서도 실패한 파일은 건너뜁니다.
+    """
+    pending = deque(all_files)
+    retry_queue = deque()  # 워커 비정상 종료에 휘말린 파일 (단독 재시도 대상)
+    in_flight = {}  # future -> (파일 경로, 단독 재시도 여부)
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+
+    def handle_broken(file_path, is_retry, error):
+        if is_retry:
+            print(f"Worker crashed while processing {file_path}: {error!r}. Skipping file.")
+        else:
+            retry_queue.append(file_path)
+
+    try:
+        while pending or retry_queue or in_flight:
+            if retry_queue:
+                # 단독 재시도는 실행 중인 작업이 모두 끝난 뒤 하나씩 실행
+                if not in_flight:
+                    file_path = retry_queue.popleft()
+                    in_flight[pool.submit(process_file, file_path)] = (file_path, True)
+            else:
+                while pending and len(in_flight) < max_workers:
+                    file_path = pending.popleft()
+                    in_flight[pool.submit(process_file, file_path)] = (file_path, False)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            pool_broken = False
+            for future in done:
+                file_path, is_retry = in_flight.pop(future)
+                try:
+                    df_cleaned = future.result()
+                except BrokenProcessPool as e:
+                    pool_broken = True
+                    handle_broken(file_path, is_retry, e)
+                    continue
+                except Exception as e:
+                    print(f"An error occurred while processing {file_path}: {e!r}")
+                    continue
+                yield file_path, df_cleaned
+
+            if pool_broken:
+                # 깨진 풀의 나머지 작업도 모두 실패하므로 재시도 대상으로 돌리고 풀을 새로 생성
+                for file_path, is_retry in in_flight.values():
+                    handle_broken(file_path, is_retry, "process pool broken")
+                in_flight.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=max_workers)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
 def run_etl():
     """전체 ETL 파이프라인을 실행합니다."""
     
@@ -102,48 +270,34 @@ def run_etl():
     all_files = glob.glob(DATA_PATH)
     total_processed_rows = 0
 
-    for file_path in all_files:
-        print(f"\n--- Processing file: {file_path} ---")
-        try:
-            # 1. Extraction (추출)
-            # 2019년도 파일은 세미콜론으로 구분되어 있음
-            delimiter = ';' if '2019' in file_path else ','
-            df = pd.read_csv(file_path, encoding='cp949', delimiter=delimiter, on_bad_lines='skip', low_memory=False) # 한글 인코딩 (CP949) 사용
-
-            # 필수 컬럼 존재 여부 확인
-            missing_cols = [col for col in REQUIRED_COLUMNS if col not in df.columns]
-            if missing_cols:
-                print(f"Skipping file: {file_path}. Missing columns: {', '.join(missing_cols)}")
-                continue
-
-            # 2. Transformation (변환)
-            df_cleaned = clean_data(df)
-            
-            if df_cleaned.empty:
-                print(f"No valid data remaining in {file_path} after cleaning. Skipping insert.")
-                continue
+    # 파일 파싱/클리닝(CPU 작업)은 프로세스 풀에서 병렬로 수행하고,
+    # DB 적재는 엔진을 가진 부모 프로세스에서만 수행 (N번 파일 적재 중 다른 파일 파싱)
+    for file_path, df_cleaned in iter_processed_files(all_files, max_workers=os.cpu_count()):
+        if df_cleaned is None:
+            continue
 
+        try:
             # 3. Loading (적재)
             print(f"Inserting {len(df_cleaned)} rows into {TARGET_TABLE}...")
             
             # to_sql을 사용하여 데이터 적재
             # if_exists='append'는 기존 데이터에 추가
             # index=False는 DataFrame의 인덱스를 DB에 넣지 않음
-            # method='multi'는 대량 삽입 성능 향상 (chunksize와 함께 사용)
+            # method=psql_copy는 COPY FROM STDIN으로 적재 (chunksize 단위로 스트림 전송)
             df_cleaned.to_sql(
                 name=TARGET_TABLE,
                 con=engine,
                 if_exists='append',
                 index=False,
-                chunksize=10000,
-                method='multi'
+                chunksize=COPY_CHUNKSIZE,
+                method=psql_copy
             )
             
             total_processed_rows += len(df_cleaned)
             print(f"Successfully inserted {len(df_cleaned)} rows from {file_path}.")
 
         except Exception as e:
-            print(f"An error occurred while processing {file_path}: {e}")
+            print(f"An error occurred while loading {file_path}: {e}")
             continue
 
     print(f"\n========================================================")
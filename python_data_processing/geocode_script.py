@@ -8,16 +8,19 @@
 
 [작동 방식]
 1. 데이터베이스에서 location이 NULL이고 address가 있는 레코드를 조회합니다.
-2. ThreadPoolExecutor를 사용하여 최대 15개의 주소를 동시에 병렬 처리합니다.
-   (카카오 API 초당 20회 제한을 고려한 안전한 설정)
+   (id 기준 키셋 페이지네이션으로 batch_size씩 조회하며, 조회 트랜잭션은 배치마다 바로 종료됩니다.)
+2. asyncio + aiohttp 이벤트 루프 하나로 여러 주소를 동시에 요청합니다.
+   (AsyncLimiter로 카카오 API 초당 20회 제한을 정확히 지킴)
 3. 각 주소를 카카오 지도 API로 지오코딩하여 경도(lon), 위도(lat)를 획득합니다.
-4. 변환된 좌표를 WKT(Well-Known Text) 형식으로 변환하여 데이터베이스에 저장합니다.
-   - location_wkt: 텍스트 형식의 WKT 좌표
+4. 변환된 좌표를 데이터베이스에 저장합니다.
    - location: PostGIS의 POINT 타입으로 변환된 좌표 (SRID: 4326)
+   - location_wkt: location을 WKT(Well-Known Text) 형식으로 변환한 텍스트 좌표
+   배치 결과(id, 경도, 위도)는 스테이징 테이블에 COPY한 뒤 UPDATE..FROM 조인 한 번으로 반영합니다.
 
 [주요 특징]
-- 병렬 처리: 15개 스레드로 동시 처리하여 속도 최적화
-- 일일 제한 관리: 하루 최대 100,000건 처리 제한 (DAILY_LIMIT)
+- 비동기 처리: 스레드 없이 단일 이벤트 루프에서 keep-alive 커넥션으로 동시 요청
+- 주소 중복 제거: 동일 주소는 배치 내에서 한 번만 호출하고, 실행 중에는 결과를 캐시
+- 일일 제한 관리: 하루 최대 100,000건 API 호출 제한 (DAILY_LIMIT, 5xx 재시도를 포함한 실제 요청 수 기준, 캐시된 주소는 제외)
 - 배치 처리: 한 번에 최대 5,000건씩 처리
 - Rate Limit 처리: API 429 에러 발생 시 자동 중단
 - 에러 복구: 개별 주소 처리 실패 시에도 계속 진행
@@ -32,16 +35,24 @@
 
 [사용 방법]
 python geocode_script.py
+(권장) 최초 실행 전 analytic_backend/scripts/create-geocode-pending-index.sql로 부분 인덱스 생성
+※ 한 번에 하나의 프로세스만 실행하세요. 여러 개를 동시에 실행하면 같은 대상 행을 나눠 갖지 않고
+  각자 처음부터 조회하므로, 같은 주소를 중복 호출하여 일일 API 할당량을 두 배로 소모합니다.
+  (UPDATE의 location IS NULL 조건은 이미 반영된 좌표를 덮어쓰지 않게 할 뿐, 중복 호출을 막지는 않음)
 
 ================================================================================
 """
 
 import os
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import io
+import csv
+import asyncio
+import aiohttp
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlalchemy.exc import SQLAlchemyError
 
 # 프로젝트 루트에서 .env 파일 로드
@@ -58,173 +69,289 @@ HEADERS = {"Authorization": f"KakaoAK {KAKAO_API_KEY}"}
 # **[추가/수정] 일일 무료 할당량 설정**
 DAILY_LIMIT = 100000
 
-# 병렬 처리 설정 (카카오 API 초당 20회 제한 고려)
-MAX_WORKERS = 15  # 동시 처리 스레드 수 (초당 20회 제한 내에서 안전하게 설정) 
+# 동시 요청 설정 (카카오 API 초당 20회 제한)
+RATE_LIMIT_PER_SECOND = 20  # AsyncLimiter로 초당 요청 수 제한
+MAX_CONNECTIONS = 20  # keep-alive 커넥션 풀 크기 (동시 요청 수 상한)
+REQUEST_TIMEOUT = 5  # 요청당 타임아웃 (초)
 
-# --- 2. DB 연결 설정 ---
+# 5xx 응답은 짧은 백오프로 재시도하고, 429는 재시도하지 않고 그대로 처리
+RETRY_STATUSES = {500, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.2  # 재시도 대기 시간 (초), 시도마다 2배씩 증가
+
+# 같은 건물의 다른 점포처럼 동일 주소가 배치를 넘어 반복되므로, 실행 중에는 결과를 메모리에 캐시
+# (정상 응답만 캐시하며, 429/타임아웃/5xx 등 일시적 실패는 캐시하지 않음)
+GEOCODE_CACHE = {}
+
+# 업데이트 쿼리가 비정상적으로 오래 걸리면 서버에서 중단 (업데이트 트랜잭션에만 적용)
+WRITE_STATEMENT_TIMEOUT_MS = 5000
+
+# --- 2. SQL 문 ---
+# 배치마다 text()를 새로 만들지 않도록 모듈 로드 시 한 번만 생성
+# 지오코딩 대상 행을 id 순서로 한 페이지씩 조회 (키셋 페이지네이션, store_ungeocoded_idx 부분 인덱스 사용)
+# 직전 페이지의 마지막 id 이후부터 조회하므로 OFFSET처럼 앞부분을 다시 훑지 않음
+PENDING_SQL = text("""
+    SELECT id, address
+    FROM store
+    WHERE location IS NULL AND address IS NOT NULL AND id > :last_id
+    ORDER BY id
+    LIMIT :n;
+""")
+
+# 스테이징 테이블(geocode_stage)의 경도/위도를 store에 조인 업데이트
+# WKT 문자열을 파싱하는 ST_GeomFromText 대신 숫자로 바로 점을 만드는 ST_MakePoint 사용
+# (SET 절의 location은 변경 전 값을 가리키므로 location_wkt는 점을 직접 만들어 변환)
+UPDATE_SQL = text("""
+    UPDATE store s
+    SET 
+        location = ST_SetSRID(ST_MakePoint(t.lon, t.lat), 4326),
+        location_wkt = ST_AsText(ST_MakePoint(t.lon, t.lat))
+    FROM geocode_stage t
+    WHERE 
+        s.id = t.id
+        AND s.location IS NULL;
+""")
+
+# --- 2-1. DB 연결 설정 ---
 try:
-    engine = create_engine(DB_URL)
+    # executemany를 페이지 단위 multi-VALUES / execute_batch로 묶어 실행
+    # 장시간 실행되는 작업에서 유휴 커넥션을 풀에 잡아두지 않도록 풀링하지 않음 (NullPool)
+    # 조회/업데이트 커넥션 모두 배치마다 새로 연결되고, API 호출 중에는 열린 트랜잭션이 없음
+    engine = create_engine(
+        DB_URL,
+        poolclass=NullPool,
+        executemany_mode='values_plus_batch',
+        insertmanyvalues_page_size=1000,
+        executemany_batch_page_size=500
+    )
     Session = sessionmaker(bind=engine)
 except Exception as e:
     print(f"ERROR: Could not create DB engine. Check .env file. Error: {e}")
     exit()
 
 # --- 3. 지오코딩 함수 ---
-def geocode_address(address):
-    """카카오 API를 사용하여 주소를 위경도로 변환합니다."""
+async def geocode_address(http, limiter, api_usage, address):
+    """
+    카카오 API를 사용하여 주소를 위경도로 변환합니다.
+    실제로 전송한 요청 수(재시도 포함)를 api_usage['calls']에 누적하며, DAILY_LIMIT에 도달하면 요청하지 않습니다.
+    """
+    if address in GEOCODE_CACHE:
+        return GEOCODE_CACHE[address]
+
     params = {'query': address}
     
     if not KAKAO_API_KEY or KAKAO_API_KEY == "YOUR_REST_API_KEY_HERE":
         print("ERROR: KAKAO_API_KEY가 .env 파일에 설정되지 않았습니다.")
         return None, None
-        
+
     try:
-        response = requests.get(KAKAO_API_URL, headers=HEADERS, params=params, timeout=5)
-        response.raise_for_status() 
-        data = response.json()
+        for attempt in range(MAX_RETRIES + 1):
+            async with limiter:
+                # 재시도를 포함해 실제로 전송하는 요청만 일일 할당량에 포함
+                if api_usage['calls'] >= DAILY_LIMIT:
+                    print(f"Daily limit reached before geocoding {address}. Left for the next run.")
+                    return None, None
+                api_usage['calls'] += 1
+                async with http.get(KAKAO_API_URL, params=params) as response:
+                    if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                        response.raise_for_status()
+                        data = await response.json()
+                        break
+            # 5xx 응답은 짧게 대기 후 재시도
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
         
+        coords = (None, None)
         if data['documents']:
             doc = data['documents'][0]
             lon = doc['x'] # 경도 (Longitude)
             lat = doc['y'] # 위도 (Latitude)
-            return lon, lat
+            coords = (lon, lat)
+
+        # 정상 응답(결과 없음 포함)만 캐시. 타임아웃/연결 오류/재시도 후에도 실패한 5xx 등은
+        # 캐시하지 않아 같은 주소를 가진 다음 행에서 다시 시도
+        GEOCODE_CACHE[address] = coords
+        return coords
         
-    except requests.exceptions.HTTPError as e:
-        if response.status_code == 429:
+    except aiohttp.ClientResponseError as e:
+        if e.status == 429:
              # 할당량 초과가 감지되면 예외를 발생시켜 메인 루프를 중단
             print(f"RATE LIMIT EXCEEDED (429) for {address}. Stopping script. Please try again tomorrow.")
             raise
-        print(f"API HTTP Error for {address}. Status: {response.status_code}. Message: {response.text}")
+        print(f"API HTTP Error for {address}. Status: {e.status}. Message: {e.message}")
         
     except Exception as e:
-        print(f"General Error during geocoding for {address}: {e}")
-        
+        # asyncio.TimeoutError처럼 메시지가 비어 있는 예외도 구분되도록 repr로 출력
+        print(f"General Error during geocoding for {address}: {e!r}")
+
     return None, None
 
-# --- 3-1. 병렬 처리를 위한 지오코딩 래퍼 함수 ---
-def geocode_with_id(id_address_pair):
-    """(id, address) 튜플을 받아서 지오코딩 결과와 함께 id를 반환합니다."""
-    id, address = id_address_pair
-    lon, lat = geocode_address(address)
-    return id, lon, lat
+# --- 3-1. 동시 처리를 위한 지오코딩 래퍼 함수 ---
+async def geocode_with_address(http, limiter, api_usage, address):
+    """완료 순서대로 결과를 처리할 수 있도록 주소와 지오코딩 결과를 함께 반환합니다."""
+    lon, lat = await geocode_address(http, limiter, api_usage, address)
+    return address, lon, lat
+
+# --- 3-2. 주소 중복 제거 함수 ---
+def group_ids_by_address(rows):
+    """(id, address) 행 목록을 {address: [id, ...]} 딕셔너리로 묶습니다."""
+    address_to_ids = {}
+    for id, address in rows:
+        address_to_ids.setdefault(address, []).append(id)
+    return address_to_ids
+
+# --- 3-3. 지오코딩 대상 조회 함수 ---
+def fetch_pending_rows(last_id, limit):
+    """last_id 이후의 지오코딩 대상 (id, address) 행을 최대 limit건 조회합니다."""
+    # 짧은 커넥션에서 조회 후 바로 닫아 API 호출 동안 스냅샷을 잡아두지 않음
+    with engine.connect() as conn:
+        return conn.execute(PENDING_SQL, {'last_id': last_id, 'n': limit}).fetchall()
+
+# --- 3-4. 좌표 일괄 업데이트 함수 ---
+def bulk_update_locations(session, update_data):
+    """
+    지오코딩 결과(id, 경도, 위도)를 임시 테이블에 COPY로 적재한 뒤, UPDATE..FROM 조인 한 번으로 반영합니다.
+    행마다 UPDATE를 실행하는 대신 계획/실행을 한 번만 수행합니다.
+    """
+    # 세션과 같은 트랜잭션에서 실행되어 배치 커밋 시 함께 반영됨
+    raw_conn = session.connection().connection
+    with raw_conn.cursor() as cur:
+        # statement_timeout은 현재 트랜잭션(이번 배치 업데이트)에만 적용
+        cur.execute(f"SET LOCAL statement_timeout = {WRITE_STATEMENT_TIMEOUT_MS};")
+
+        # NullPool이라 커밋 시 커넥션이 닫히므로 임시 테이블은 배치마다 새로 생성됨
+        # (ON COMMIT DELETE ROWS는 같은 커넥션이 재사용되는 경우에도 행이 남지 않도록 보장)
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS geocode_stage (
+                id bigint PRIMARY KEY,
+                lon double precision NOT NULL,
+                lat double precision NOT NULL
+            ) ON COMMIT DELETE ROWS;
+        """)
+
+        buf = io.StringIO()
+        csv.writer(buf).writerows((row['id'], row['lon'], row['lat']) for row in update_data)
+        buf.seek(0)
+        cur.copy_expert("COPY geocode_stage (id, lon, lat) FROM STDIN WITH CSV", buf)
+
+    session.execute(UPDATE_SQL)
 
 # --- 4. 메인 Geocoding 실행 함수 ---
-def run_geocoding():
+async def run_geocoding():
+    loop = asyncio.get_running_loop()
     session = Session()
     # 병렬 처리 시 더 큰 배치 크기 사용 가능
     batch_size = 5000 
     
     print("Starting Geocoding Process...")
-    print(f"Daily processing limit: {DAILY_LIMIT} requests.")
+    print(f"Daily processing limit: {DAILY_LIMIT} API requests.")
+
+    total_geocoded_count = 0  # 전체 DB에 반영된 수 (이전 세션 포함)
+    session_geocoded_count = 0 # 이번 세션에서 좌표를 반영한 행 수
+    api_usage = {'calls': 0} # 이번 세션에서 실제로 전송한 API 요청 수 (5xx 재시도 포함, DAILY_LIMIT 기준)
+
+    # DB 작업은 동기 드라이버를 사용하므로 이벤트 루프를 막지 않도록 executor에서 실행
+    # 조회는 배치마다 짧은 커넥션으로, 업데이트는 session의 커넥션으로 수행하고 배치마다 커밋
+    last_id = 0 # 직전 페이지에서 조회한 마지막 id (키셋 페이지네이션 기준)
     
+    # 초당 요청 수 제한과 keep-alive 커넥션 풀을 모든 요청이 공유
+    limiter = AsyncLimiter(RATE_LIMIT_PER_SECOND, 1)
+    connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
     try:
-        total_geocoded_count = 0  # 전체 DB에 반영된 수 (이전 세션 포함)
-        session_geocoded_count = 0 # 이번 세션에서 처리한 수
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as http:
+            while api_usage['calls'] < DAILY_LIMIT: # [수정] API 호출 10만 건 미만일 때만 반복
+                
+                # 남은 API 호출 할당량 계산
+                remaining_limit = DAILY_LIMIT - api_usage['calls']
 
-        while session_geocoded_count < DAILY_LIMIT: # [수정] 10만 건 미만일 때만 반복
-            
-            # 남은 할당량 계산 후 배치 사이즈 조정
-            remaining_limit = DAILY_LIMIT - session_geocoded_count
-            current_limit = min(batch_size, remaining_limit)
-
-            if current_limit <= 0:
-                print(f"Daily limit of {DAILY_LIMIT} reached. Stopping now.")
-                break
-
-            # location이 NULL인 행을 current_limit 만큼 가져옵니다.
-            query = text(f"""
-                SELECT id, address
-                FROM store
-                WHERE location IS NULL AND address IS NOT NULL
-                LIMIT {current_limit};
-            """)
-            
-            result = session.execute(query).fetchall()
-            
-            if not result:
-                print("No more un-geocoded addresses found. Job complete.")
-                break 
-            
-            print(f"\n-> Processing batch of {len(result)} addresses (Limit remaining: {remaining_limit})...")
-            
-            update_data = []
-            rate_limit_exceeded = False
-            
-            # 병렬 처리로 여러 주소를 동시에 지오코딩
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                # 모든 작업을 제출
-                future_to_pair = {
-                    executor.submit(geocode_with_id, (id, address)): (id, address) 
-                    for id, address in result
-                    if session_geocoded_count < DAILY_LIMIT
-                }
+                # location이 NULL인 행을 id 순서로 batch_size 만큼 가져옵니다.
+                # 좌표를 찾지 못한 행도 다시 조회하지 않도록 마지막 id 이후부터 조회
+                result = await loop.run_in_executor(None, fetch_pending_rows, last_id, batch_size)
+                
+                if not result:
+                    print("No more un-geocoded addresses found. Job complete.")
+                    break 
+                last_id = result[-1][0]
+                
+                # 같은 주소는 한 번만 API를 호출하도록 주소별로 id를 묶음
+                address_to_ids = group_ids_by_address(result)
+
+                # 캐시에 없는 주소만 API를 호출하므로, 남은 할당량만큼만 요청
+                uncached_addresses = [a for a in address_to_ids if a not in GEOCODE_CACHE]
+                if len(uncached_addresses) > remaining_limit:
+                    uncached_addresses = uncached_addresses[:remaining_limit]
+                    print(f"Daily limit of {DAILY_LIMIT} will be reached in this batch. Remaining addresses are left for the next run.")
+                uncached_set = set(uncached_addresses)
+                batch_addresses = [a for a in address_to_ids if a in GEOCODE_CACHE or a in uncached_set]
+
+                print(f"\n-> Processing batch of {len(result)} addresses ({len(address_to_ids)} unique, {len(uncached_addresses)} API calls, Limit remaining: {remaining_limit})...")
+                
+                update_data = []
+                rate_limit_exceeded = False
+                
+                # 고유 주소별로 요청을 동시에 시작
+                tasks = [
+                    asyncio.ensure_future(geocode_with_address(http, limiter, api_usage, address))
+                    for address in batch_addresses
+                ]
                 
                 # 완료된 작업부터 처리
-                for future in as_completed(future_to_pair):
-                    # 일일 제한 체크
-                    if session_geocoded_count >= DAILY_LIMIT:
-                        # 남은 작업 취소
-                        for f in future_to_pair:
-                            f.cancel()
-                        break
-                    
+                for next_done in asyncio.as_completed(tasks):
                     try:
-                        id, lon, lat = future.result()
-                        
+                        address, lon, lat = await next_done
                         if lon and lat:
-                            wkt_point = f"POINT({lon} {lat})"
-                            update_data.append({
-                                'id': id, 
-                                'wkt': wkt_point
-                            })
-                            session_geocoded_count += 1 # 성공 카운트 증가
+                            # 같은 주소를 가진 모든 점포에 동일 좌표 적용
+                            ids = address_to_ids[address]
+                            update_data.extend({'id': id, 'lon': lon, 'lat': lat} for id in ids)
                             
-                    except requests.exceptions.HTTPError:
+                    except aiohttp.ClientResponseError:
                         # 429 에러가 발생하면 모든 작업 중단 (geocode_address에서 이미 raise됨)
                         rate_limit_exceeded = True
-                        for f in future_to_pair:
-                            f.cancel()
                         break
                     except Exception as e:
                         # 개별 에러는 로그만 남기고 계속 진행
-                        id, address = future_to_pair[future]
-                        print(f"Error processing {address}: {e}")
-            
-            # Rate limit 초과 시 전체 프로세스 중단
-            if rate_limit_exceeded:
-                raise requests.exceptions.HTTPError("Rate limit exceeded (429)") 
+                        print(f"Error processing batch item: {e}")
 
-            # 5. DB 업데이트
-            if update_data:
-                print(f"Updating {len(update_data)} rows with coordinates...")
-                
-                update_sql = text("""
-                    UPDATE store
-                    SET 
-                        location_wkt = :wkt,
-                        location = ST_SetSRID(ST_GeomFromText(:wkt), 4326)
-                    WHERE 
-                        id = :id;
-                """)
+                # 남은 작업 취소
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
                 
-                session.execute(update_sql, update_data)
-                session.commit()
+                # Rate limit 초과 시 전체 프로세스 중단
+                if rate_limit_exceeded:
+                    raise RuntimeError("Rate limit exceeded (429)") 
+
+                # 5. DB 업데이트
+                if update_data:
+                    print(f"Updating {len(update_data)} rows with coordinates...")
+                    
+                    await loop.run_in_executor(None, bulk_update_locations, session, update_data)
+                    
+                else:
+                     print("No valid coordinates found in this batch or addresses skipped.")
+
+                # 배치마다 커밋하여 진행 상황을 반영
+                await loop.run_in_executor(None, session.commit)
+
+                # 커밋까지 성공한 배치만 반영 행 수에 포함 (중단/롤백된 배치는 제외)
                 total_geocoded_count += len(update_data)
-                
+                session_geocoded_count += len(update_data)
             else:
-                 print("No valid coordinates found in this batch or addresses skipped.")
+                print(f"Daily limit of {DAILY_LIMIT} API calls reached. Stopping now.")
             
     except Exception as e:
         session.rollback()
-        print(f"\nCRITICAL ERROR: Stopping Geocoding process. Total successful updates in this session: {session_geocoded_count}. Error: {e}")
+        print(f"\nCRITICAL ERROR: Stopping Geocoding process. API calls this session: {api_usage['calls']}. Error: {e}")
         
     finally:
         session.close()
         print(f"\n==========================================================")
-        print(f"Geocoding Session Finished. Updates this session: {session_geocoded_count}")
+        print(f"Geocoding Session Finished. API calls this session: {api_usage['calls']} / {DAILY_LIMIT}")
+        print(f"Rows updated this session: {session_geocoded_count}")
         print(f"If the limit was reached, please run the script again tomorrow.")
         print(f"==========================================================")
 
 
 if __name__ == "__main__":
-    run_geocoding()
\ No newline at end of file
+    asyncio.run(run_geocoding())
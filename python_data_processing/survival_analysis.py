@@ -32,6 +32,36 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# SQL 문은 모듈 로드 시 한 번만 생성하여 재사용
+# 업종별 평균 생존 일수 집계
+# store 테이블 컬럼은 camelCase("openDate", "closeDate")이므로 따옴표로 감싸서 참조
+# (analytic_backend/scripts/create-closed-store-partial-index.sql의 부분 인덱스 사용)
+SURVIVAL_SUMMARY_SQL = text("""
+    SELECT
+        "sector",
+        ROUND(AVG("closeDate" - "openDate")::numeric, 2) AS avg_duration_days,
+        COUNT(*) AS sample_size
+    FROM store
+    WHERE "closeDate" IS NOT NULL
+      AND "openDate" IS NOT NULL
+      AND "sector" IS NOT NULL
+      AND "closeDate" >= "openDate"
+    GROUP BY "sector"
+""")
+
+# survival_analysis 테이블 UPSERT
+UPSERT_SQL = text("""
+    INSERT INTO survival_analysis (
+        sector, avg_duration_days, sample_size, calculated_at, updated_at
+    )
+    VALUES (:sector, :avg_duration_days, :sample_size, :calculated_at, :updated_at)
+    ON CONFLICT (sector)
+    DO UPDATE SET
+        avg_duration_days = EXCLUDED.avg_duration_days,
+        sample_size = EXCLUDED.sample_size,
+        updated_at = EXCLUDED.updated_at
+""")
+
 
 def get_db_connection() -> Optional[create_engine]:
     """
@@ -45,7 +75,14 @@ def get_db_connection() -> Optional[create_engine]:
             f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
             f"@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
         )
-        engine = create_engine(db_url)
+        # executemany를 페이지 단위 multi-VALUES / execute_batch로 묶어 실행
+        # (text() 기반 UPSERT는 execute_batch 경로를 사용)
+        engine = create_engine(
+            db_url,
+            executemany_mode='values_plus_batch',
+            insertmanyvalues_page_size=1000,
+            executemany_batch_page_size=500
+        )
         logger.info("데이터베이스 연결 성공")
         return engine
     except Exception as e:
@@ -53,79 +90,29 @@ def get_db_connection() -> Optional[create_engine]:
         return None
 
 
-def fetch_closed_stores(engine: create_engine) -> pd.DataFrame:
+def fetch_survival_summary(engine: create_engine) -> pd.DataFrame:
     """
-    폐업한 점포 데이터를 조회합니다.
+    폐업 점포의 업종별 평균 생존 일수를 PostgreSQL에서 집계하여 조회합니다.
+    
+    개별 점포 행을 가져오지 않고 DB에서 GROUP BY로 집계하므로
+    전송량과 pandas 변환 비용이 업종 수 수준으로 줄어듭니다.
+    음수 생존 일수(데이터 오류)는 "closeDate" >= "openDate" 조건으로 제외합니다.
     
     Args:
         engine: SQLAlchemy 엔진 객체
         
     Returns:
-        폐업 점포 데이터를 담은 pandas DataFrame
+        업종별 평균 생존 일수와 샘플 크기를 담은 DataFrame
     """
-    query = text("""
-        SELECT 
-            sector,
-            open_date,
-            close_date
-        FROM store
-        WHERE close_date IS NOT NULL
-          AND open_date IS NOT NULL
-          AND sector IS NOT NULL
-    """)
-    
     try:
-        df = pd.read_sql(query, engine)
-        logger.info(f"폐업 점포 데이터 조회 완료: {len(df)}건")
-        return df
+        result = pd.read_sql(SURVIVAL_SUMMARY_SQL, engine)
+        logger.info(f"업종별 평균 생존 일수 집계 완료: {len(result)}개 업종")
+        return result
     except Exception as e:
-        logger.error(f"폐업 점포 데이터 조회 실패: {e}")
+        logger.error(f"업종별 생존 일수 집계 실패: {e}")
         raise
 
 
-def calculate_survival_duration(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    생존 일수를 계산하고 업종별 평균을 산출합니다.
-    
-    Args:
-        df: 폐업 점포 데이터 DataFrame
-        
-    Returns:
-        업종별 평균 생존 일수와 샘플 크기를 담은 DataFrame
-    """
-    if df.empty:
-        logger.warning("폐업 점포 데이터가 없습니다.")
-        return pd.DataFrame()
-    
-    # 생존 일수 계산
-    df['duration_days'] = (df['close_date'] - df['open_date']).dt.days
-    
-    # 음수 값 제거 (데이터 오류 방지)
-    initial_count = len(df)
-    df = df[df['duration_days'] >= 0]
-    removed_count = initial_count - len(df)
-    
-    if removed_count > 0:
-        logger.warning(f"음수 생존 일수 데이터 {removed_count}건 제거됨")
-    
-    if df.empty:
-        logger.warning("유효한 생존 일수 데이터가 없습니다.")
-        return pd.DataFrame()
-    
-    # 업종별 평균 계산
-    result = df.groupby('sector').agg({
-        'duration_days': ['mean', 'count']
-    }).reset_index()
-    
-    result.columns = ['sector', 'avg_duration_days', 'sample_size']
-    
-    # 소수점 2자리 반올림
-    result['avg_duration_days'] = result['avg_duration_days'].round(2)
-    
-    logger.info(f"업종별 평균 생존 일수 계산 완료: {len(result)}개 업종")
-    return result
-
-
 def save_to_database(engine: create_engine, result: pd.DataFrame) -> None:
     """
     계산 결과를 survival_analysis 테이블에 저장합니다 (UPSERT).
@@ -139,28 +126,13 @@ def save_to_database(engine: create_engine, result: pd.DataFrame) -> None:
         return
     
     now = datetime.now()
-    upsert_query = text("""
-        INSERT INTO survival_analysis (
-            sector, avg_duration_days, sample_size, calculated_at, updated_at
-        )
-        VALUES (:sector, :avg_duration_days, :sample_size, :calculated_at, :updated_at)
-        ON CONFLICT (sector)
-        DO UPDATE SET
-            avg_duration_days = EXCLUDED.avg_duration_days,
-            sample_size = EXCLUDED.sample_size,
-            updated_at = EXCLUDED.updated_at
-    """)
     
     try:
+        # 행 단위 실행 대신 파라미터 리스트를 한 번에 전달 (executemany)
+        # to_dict(orient='records')는 numpy 타입을 파이썬 기본 타입으로 변환해 줌
+        params = result.assign(calculated_at=now, updated_at=now).to_dict(orient='records')
         with engine.connect() as conn:
-            for _, row in result.iterrows():
-                conn.execute(upsert_query, {
-                    'sector': row['sector'],
-                    'avg_duration_days': float(row['avg_duration_days']),
-                    'sample_size': int(row['sample_size']),
-                    'calculated_at': now,
-                    'updated_at': now
-                })
+            conn.execute(UPSERT_SQL, params)
             conn.commit()
         
         logger.info(f"survival_analysis 테이블에 {len(result)}개 업종 데이터 저장 완료")
@@ -187,18 +159,11 @@ def main():
         return
     
     try:
-        # 2. 폐업 점포 데이터 조회
-        df = fetch_closed_stores(engine)
-        
-        if df.empty:
-            logger.warning("분석할 데이터가 없습니다.")
-            return
-        
-        # 3. 생존 일수 계산 및 업종별 평균 산출
-        result = calculate_survival_duration(df)
+        # 2~3. 폐업 점포의 생존 일수 계산 및 업종별 평균 산출 (DB에서 집계)
+        result = fetch_survival_summary(engine)
         
         if result.empty:
-            logger.warning("계산 결과가 없습니다.")
+            logger.warning("분석할 데이터가 없습니다.")
             return
         
         # 4. 결과를 데이터베이스에 저장